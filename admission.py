@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+# Admission control in front of provider dispatch.
+# Each provider gets a bounded number of concurrent calls. Waiting requests are
+# queued per user and served round-robin so one chatty user cannot starve the
+# rest, while messages flagged as crisis skip ahead in their own lane and may use
+# a few reserved slots. When the queue is full or a wait times out the caller is
+# told to shed the request (serve a fallback reply) instead of piling up.
+
+PROVIDER_MAX_CONCURRENCY = int(os.getenv("PROVIDER_MAX_CONCURRENCY", "4"))
+CRISIS_RESERVED_SLOTS = int(os.getenv("CRISIS_RESERVED_SLOTS", "2"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+ADMISSION_MAX_PER_USER = int(os.getenv("ADMISSION_MAX_PER_USER", "2"))
+CRISIS_MAX_QUEUE = int(os.getenv("CRISIS_MAX_QUEUE", "16"))
+CRISIS_MAX_PER_USER = int(os.getenv("CRISIS_MAX_PER_USER", "4"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+CRISIS_QUEUE_TIMEOUT = float(os.getenv("CRISIS_QUEUE_TIMEOUT", "30"))
+
+# acquire() results
+ADMITTED = "admitted"  # caller holds a slot and MUST call release()
+SHED = "shed"          # overloaded, serve a fallback reply (crisis callers always get this, never a 503)
+REJECTED = "rejected"  # user already has too many requests in flight, answer 503
+
+CRISIS_KEYWORDS = [
+    "suicide", "suicidal", "kill myself", "killing myself", "end my life",
+    "want to die", "self-harm", "self harm", "hurt myself", "harm myself",
+    "cut myself", "cutting myself", "no reason to live", "better off dead",
+    "आत्महत्या", "मरना चाहता", "मरना चाहती", "मरायचे",
+]
+
+
+def is_crisis(message: str) -> bool:
+    m = (message or "").lower()
+    return any(word in m for word in CRISIS_KEYWORDS)
+
+
+class _Ticket:
+    __slots__ = ("user_key", "crisis", "granted")
+
+    def __init__(self, user_key, crisis):
+        self.user_key = user_key
+        self.crisis = crisis
+        self.granted = False
+
+
+class _ProviderGate:
+    def __init__(self, limit, reserved, max_queue, crisis_max_queue):
+        self.cond = threading.Condition()
+        self.limit = limit
+        self.reserved = reserved
+        self.max_queue = max_queue
+        self.crisis_max_queue = crisis_max_queue
+        self.active = 0
+        self.crisis_queue = deque()
+        self.user_queues = OrderedDict()  # {user_key: deque of tickets}, round-robin order
+        self.queued = 0
+        self.per_user = {}  # {user_key: queued + active}
+
+    def _has_room(self, crisis):
+        cap = self.limit + self.reserved if crisis else self.limit
+        return self.active < cap
+
+    def _grant_next(self):
+        # Called with the lock held whenever a slot may have opened up.
+        granted = False
+        while self.crisis_queue and self._has_room(True):
+            ticket = self.crisis_queue.popleft()
+            self._grant(ticket)
+            granted = True
+        while self.user_queues and self._has_room(False):
+            user_key, tickets = self.user_queues.popitem(last=False)
+            ticket = tickets.popleft()
+            if tickets:
+                self.user_queues[user_key] = tickets
+            self._grant(ticket)
+            granted = True
+        if granted:
+            self.cond.notify_all()
+
+    def _grant(self, ticket):
+        ticket.granted = True
+        self.queued -= 1
+        self.active += 1
+
+    def _dequeue(self, ticket):
+        if ticket.crisis:
+            self.crisis_queue.remove(ticket)
+        else:
+            tickets = self.user_queues[ticket.user_key]
+            tickets.remove(ticket)
+            if not tickets:
+                del self.user_queues[ticket.user_key]
+        self.queued -= 1
+
+    def _forget_user(self, user_key):
+        self.per_user[user_key] -= 1
+        if self.per_user[user_key] <= 0:
+            del self.per_user[user_key]
+
+    def acquire(self, user_key, crisis):
+        with self.cond:
+            in_flight = self.per_user.get(user_key, 0)
+            if crisis:
+                # The crisis lane is bounded too; when it is full the caller gets the
+                # crisis fallback (helpline resources) right away instead of waiting
+                if in_flight >= CRISIS_MAX_PER_USER or len(self.crisis_queue) >= self.crisis_max_queue:
+                    return SHED
+            else:
+                if in_flight >= ADMISSION_MAX_PER_USER:
+                    return REJECTED
+                if self.queued - len(self.crisis_queue) >= self.max_queue:
+                    return SHED
+
+            ticket = _Ticket(user_key, crisis)
+            self.per_user[user_key] = self.per_user.get(user_key, 0) + 1
+            self.queued += 1
+            if crisis:
+                self.crisis_queue.append(ticket)
+            else:
+                self.user_queues.setdefault(user_key, deque()).append(ticket)
+            self._grant_next()
+
+            timeout = CRISIS_QUEUE_TIMEOUT if crisis else ADMISSION_QUEUE_TIMEOUT
+            deadline = time.monotonic() + timeout
+            while not ticket.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._dequeue(ticket)
+                    self._forget_user(user_key)
+                    return SHED
+                self.cond.wait(remaining)
+            return ADMITTED
+
+    def release(self, user_key):
+        with self.cond:
+            self.active -= 1
+            self._forget_user(user_key)
+            self._grant_next()
+
+    def stats(self):
+        with self.cond:
+            return {
+                "active": self.active,
+                "queued": self.queued,
+                "crisis_queued": len(self.crisis_queue),
+            }
+
+
+_gates = {}
+_gates_lock = threading.Lock()
+
+
+def _gate(provider):
+    with _gates_lock:
+        gate = _gates.get(provider)
+        if gate is None:
+            gate = _ProviderGate(PROVIDER_MAX_CONCURRENCY, CRISIS_RESERVED_SLOTS, ADMISSION_MAX_QUEUE, CRISIS_MAX_QUEUE)
+            _gates[provider] = gate
+        return gate
+
+
+def acquire(provider: str, user_key: str, crisis: bool = False) -> str:
+    return _gate(provider).acquire(str(user_key), crisis)
+
+
+def release(provider: str, user_key: str):
+    _gate(provider).release(str(user_key))
+
+
+def stats(provider: str):
+    return _gate(provider).stats()
@@ -9,7 +9,7 @@ if not hasattr(collections, 'MutableMapping'):
     collections.Iterable = collections.abc.Iterable
     collections.Callable = collections.abc.Callable
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 from functools import wraps
 from datetime import datetime, timedelta
 import requests
@@ -17,8 +17,12 @@ import requests
 from passlib.context import CryptContext
 import jwt
 import db
+import admission
 from dotenv import load_dotenv
 import json
+import csv
+import io
+import zlib
 
 load_dotenv()
 
@@ -97,6 +101,10 @@ def token_required(f):
 
 def _fallback_response(message: str) -> str:
     m = message.lower()
+    if admission.is_crisis(message):
+        return ("I’m really sorry you’re feeling this way, and I’m glad you told me. You don’t have to go through this alone. "
+                "Please reach out right now to the 988 Suicide & Crisis Lifeline (call or text 988 in the US), "
+                "or your local emergency number or crisis helpline. Would you like to keep talking while you do?")
     if any(word in m for word in ["hello", "hi", "hey"]):
         return "Hello! I’m here to support you. How are you feeling today?"
     if any(word in m for word in ["stress", "stressed", "overwhelmed"]):
@@ -213,6 +221,13 @@ def _groq_reply(message: str, system_prompt: str) -> str:
         print(f"Groq Exception: {e}")
         return None
 
+PROVIDERS = {
+    "groq": _groq_reply,
+    "gemini": _gemini_reply,
+    "grok": _grok_reply,
+    "ollama": _ollama_reply,
+}
+
 # --- Removed standalone _analyze_sentiment to favor combined prompt optimization ---
 
 # --- Routes ---
@@ -312,35 +327,47 @@ def chat_api():
     if not provider:
         provider = "groq" if os.getenv("GROQ_API_KEY") else ("gemini" if os.getenv("GEMINI_API_KEY") else "ollama")
     
-    # Save user message to DB
+    # Save user message to DB before admission (which can wait); its mood is attached after parsing
+    user_log_id = None
     try:
         if db.check_connection():
-            db.save_log("user", message, user_id=user_id, session_id=session_id)
+            user_log_id = db.save_log("user", message, user_id=user_id, session_id=session_id)
     except Exception:
         pass
         
+    # Admission control: bounded per-provider concurrency, crisis messages first
+    crisis = admission.is_crisis(message)
+    # session_id is client-supplied, so anonymous callers are keyed by address
+    user_key = user_id or request.remote_addr
+    admit = admission.SHED
+    if provider in PROVIDERS:
+        admit = admission.acquire(provider, user_key, crisis=crisis)
+        if admit == admission.REJECTED:
+            return jsonify({"error": "Too many requests in progress. Please wait a moment and try again."}), 503
+        if admit == admission.SHED:
+            print(f"DEBUG: Provider {provider} overloaded, serving fallback (crisis: {crisis}, load: {admission.stats(provider)})")
+
     raw_reply = None
-    if provider == "groq":
-        raw_reply = _groq_reply(full_prompt_message, current_system_prompt)
-    elif provider == "gemini":
-        raw_reply = _gemini_reply(full_prompt_message, current_system_prompt)
-    elif provider == "grok":
-        raw_reply = _grok_reply(full_prompt_message, current_system_prompt)
-    elif provider == "ollama":
-        raw_reply = _ollama_reply(full_prompt_message, current_system_prompt)
+    if admit == admission.ADMITTED:
+        try:
+            raw_reply = PROVIDERS[provider](full_prompt_message, current_system_prompt)
+        finally:
+            admission.release(provider, user_key)
     
     if not raw_reply:
         raw_reply = _fallback_response(message)
         
     # Parse sentiment and reply
     sentiment = "neutral"
+    tagged_sentiment = None # only a parsed tag is stored; fallback replies carry no mood
     reply = raw_reply
     if "[MOOD:" in raw_reply:
         try:
             parts = raw_reply.split("]", 1)
             mood_tag = parts[0].replace("[MOOD:", "").strip().lower()
-            if mood_tag in ["happy", "sad", "anxious", "angry", "calm", "neutral"]:
+            if mood_tag in db.MOODS:
                 sentiment = mood_tag
+                tagged_sentiment = mood_tag
             reply = parts[1].strip()
         except Exception:
             pass
@@ -353,9 +380,10 @@ def chat_api():
     if len(session_memory[session_id]) > 20:
         session_memory[session_id] = session_memory[session_id][-20:]
 
-    # Save assistant reply to DB
+    # Save assistant reply to DB, and the detected mood with the user message
     try:
         if db.check_connection():
+            db.record_sentiment(user_log_id, user_id, tagged_sentiment)
             db.save_log("assistant", reply, user_id=user_id, session_id=session_id)
     except Exception:
         pass
@@ -388,6 +416,67 @@ def get_sessions(user_id, email):
     sessions = db.get_user_sessions(user_id)
     return jsonify(sessions)
 
+@app.route('/api/insights', methods=['GET'])
+@token_required
+def get_insights(user_id, email):
+    period = request.args.get('period', 'day')
+    if period not in db.INSIGHT_PERIODS:
+        return jsonify({"error": "Invalid period"}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 30)), 1), 366)
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+    if not db.check_connection():
+        return jsonify({"error": "Database error"}), 503
+    return jsonify({"period": period, "rollups": db.get_user_insights(user_id, period, limit)})
+
+EXPORT_FIELDS = ["session_id", "ts", "role", "content", "sentiment"]
+
+def _gzip_stream(lines):
+    # wbits=31 writes a gzip container, so the download is a plain .gz file
+    # On error the exception aborts the chunked response before the gzip trailer,
+    # so the client sees a failed download rather than a short but valid file
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    try:
+        for line in lines:
+            chunk = compressor.compress(line.encode("utf-8"))
+            if chunk:
+                yield chunk
+    except Exception as e:
+        print(f"DEBUG: Export aborted: {e}")
+        raise
+    yield compressor.flush()
+
+def _export_lines(user_id, fmt):
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(EXPORT_FIELDS)
+        for row in db.iter_user_logs(user_id):
+            writer.writerow([row.get(f) for f in EXPORT_FIELDS])
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate(0)
+        yield buf.getvalue()
+    else:
+        for row in db.iter_user_logs(user_id):
+            yield json.dumps({f: row.get(f) for f in EXPORT_FIELDS}, ensure_ascii=False) + "\n"
+
+@app.route('/api/export', methods=['GET'])
+@token_required
+def export_data(user_id, email):
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ("ndjson", "csv"):
+        return jsonify({"error": "Invalid format"}), 400
+    if not db.check_connection():
+        return jsonify({"error": "Database error"}), 503
+    filename = f"mindcare-export-{datetime.utcnow():%Y%m%d}.{fmt}.gz"
+    return Response(
+        stream_with_context(_gzip_stream(_export_lines(user_id, fmt))),
+        mimetype="application/gzip",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
 @app.route('/api/new_chat', methods=['POST'])
 def new_chat():
     import uuid
@@ -0,0 +1,94 @@
+import os
+import gzip
+import json
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Cold storage for old chat sessions.
+# Sessions idle for longer than ARCHIVE_AFTER_DAYS are moved out of chat_logs into
+# one compressed NDJSON segment per month (by session start). Every archived session
+# is written as its own gzip member, so the segment stays a valid .ndjson.gz file
+# while the chat_archive index can point at the exact bytes of a single session.
+
+# Anchored to the app directory: the retention job usually runs from cron, whose
+# working directory is not the one the web app reads segments from
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+ARCHIVE_DIR = os.path.join(_APP_DIR, os.getenv("ARCHIVE_DIR", "archive"))
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+
+def segment_name(ts) -> str:
+    return ts.strftime("%Y-%m")
+
+def _segment_path(segment: str) -> str:
+    return os.path.join(ARCHIVE_DIR, f"chat_logs-{segment}.ndjson.gz")
+
+@contextmanager
+def retention_lock():
+    """Exclusive, non-blocking lock for one retention run; yields False if another run holds it.
+
+    Segment offsets come from f.tell() at append time, so two writers on the same
+    segment could index each other's bytes.
+    """
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    f = open(os.path.join(ARCHIVE_DIR, ".retention.lock"), "a+")
+    try:
+        try:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    finally:
+        f.close()
+
+def append_session(segment: str, rows):
+    """Append rows as one gzip member; returns (byte_offset, byte_length) for the index."""
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    payload = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows)
+    member = gzip.compress(payload.encode("utf-8"))
+    with open(_segment_path(segment), "ab") as f:
+        f.seek(0, os.SEEK_END)
+        offset = f.tell()
+        f.write(member)
+        f.flush()
+        os.fsync(f.fileno())
+    return offset, len(member)
+
+def read_session(segment: str, byte_offset: int, byte_length: int, strict: bool = False):
+    """Rows of one archived session. A missing or corrupt segment raises when
+    `strict` (exports must not silently drop data), otherwise yields no rows."""
+    try:
+        with open(_segment_path(segment), "rb") as f:
+            f.seek(byte_offset)
+            member = f.read(byte_length)
+        if len(member) != byte_length:
+            raise EOFError(f"segment {segment} truncated at offset {byte_offset}")
+        return [json.loads(line) for line in gzip.decompress(member).decode("utf-8").splitlines() if line]
+    except Exception as e:
+        if strict:
+            raise
+        print(f"DEBUG: Error reading archive segment {segment}: {e}")
+        return []
+
+if __name__ == '__main__':
+    # Retention job, e.g. from cron: python archive.py
+    import db
+    if db.check_connection():
+        moved = db.archive_old_sessions(ARCHIVE_AFTER_DAYS)
+        print(f"DEBUG: Archived {moved} session(s) older than {ARCHIVE_AFTER_DAYS} days.")
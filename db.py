@@ -3,7 +3,8 @@ import sys
 import json
 import mysql.connector
 from mysql.connector import errorcode
-from datetime import datetime
+from datetime import datetime, timedelta
+import archive
 
 # MySQL Connection Setup
 MYSQL_HOST = os.getenv("MYSQL_HOST", "localhost")
@@ -11,6 +12,12 @@ MYSQL_USER = os.getenv("MYSQL_USER", "root")
 MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "vinay")
 MYSQL_DATABASE = os.getenv("MYSQL_DATABASE", "rm")
 
+# Moods the assistant tags each user message with ([MOOD: ...])
+MOODS = ["happy", "sad", "anxious", "angry", "calm", "neutral"]
+INSIGHT_PERIODS = ["day", "week"]
+# A gap longer than this between two messages of a session counts as a new visit
+SESSION_IDLE_SECONDS = int(os.getenv("SESSION_IDLE_SECONDS", "1800"))
+
 # Fallback JSON File
 JSON_DB_FILE = "local_db.json"
 
@@ -117,7 +124,55 @@ def ensure_schema():
                 user_id VARCHAR(255),
                 session_id VARCHAR(255),
                 ts DATETIME DEFAULT CURRENT_TIMESTAMP,
-                INDEX idx_user_session (user_id, session_id)
+                INDEX idx_user_session_ts (user_id, session_id, ts)
+            )
+        """)
+        _ensure_column(cursor, "chat_logs", "sentiment", "VARCHAR(20) NULL")
+        # History reads sort by ts within a session; the retention job scans by ts
+        _ensure_index(cursor, "chat_logs", "idx_user_session_ts", "(user_id, session_id, ts)")
+        _ensure_index(cursor, "chat_logs", "idx_ts", "(ts)")
+        # Older installs: (user_id, session_id) is a prefix of idx_user_session_ts
+        _drop_index(cursor, "chat_logs", "idx_user_session")
+        # Index of sessions moved to compressed archive segments (see archive.py)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS chat_archive (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                user_id VARCHAR(255),
+                session_id VARCHAR(255) NOT NULL,
+                segment VARCHAR(16) NOT NULL,
+                byte_offset BIGINT NOT NULL,
+                byte_length INT NOT NULL,
+                messages INT NOT NULL,
+                started_at DATETIME NOT NULL,
+                ended_at DATETIME NOT NULL,
+                INDEX idx_archive_user_session (user_id, session_id)
+            )
+        """)
+        # Per-session bookkeeping so rollups can be updated incrementally on write
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS session_stats (
+                user_id VARCHAR(255) NOT NULL,
+                session_id VARCHAR(255) NOT NULL,
+                last_at DATETIME NOT NULL,
+                PRIMARY KEY (user_id, session_id),
+                INDEX idx_last_at (last_at)
+            )
+        """)
+        _drop_column(cursor, "session_stats", "started_at")
+        _drop_column(cursor, "session_stats", "turns")
+        _ensure_index(cursor, "session_stats", "idx_last_at", "(last_at)")
+        # Per user per day/week rollups served by /api/insights
+        mood_columns = ",\n".join(f"                mood_{m} INT NOT NULL DEFAULT 0" for m in MOODS)
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS user_insights (
+                user_id VARCHAR(255) NOT NULL,
+                period VARCHAR(10) NOT NULL,
+                period_start DATE NOT NULL,
+                messages INT NOT NULL DEFAULT 0,
+                sessions INT NOT NULL DEFAULT 0,
+                session_seconds INT NOT NULL DEFAULT 0,
+{mood_columns},
+                PRIMARY KEY (user_id, period, period_start)
             )
         """)
         conn.commit()
@@ -127,66 +182,278 @@ def ensure_schema():
     except Exception as e:
         print(f"DEBUG: Schema error: {e}")
 
+def _ensure_column(cursor, table: str, column: str, definition: str):
+    # MySQL has no ADD COLUMN IF NOT EXISTS, so check information_schema first
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+        (table, column)
+    )
+    if cursor.fetchone()[0] == 0:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def _drop_column(cursor, table: str, column: str):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+        (table, column)
+    )
+    if cursor.fetchone()[0] > 0:
+        cursor.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+
+def _ensure_index(cursor, table: str, index: str, columns: str):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s",
+        (table, index)
+    )
+    if cursor.fetchone()[0] == 0:
+        cursor.execute(f"CREATE INDEX {index} ON {table} {columns}")
+
+def _drop_index(cursor, table: str, index: str):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s",
+        (table, index)
+    )
+    if cursor.fetchone()[0] > 0:
+        cursor.execute(f"DROP INDEX {index} ON {table}")
+
+def _period_start(period: str, ts: datetime):
+    d = ts.date()
+    if period == "week":
+        return d - timedelta(days=d.weekday())
+    return d
+
+def _rollup_deltas(last_at, now: datetime):
+    # For each period: (period, period_start, sessions to add, session seconds to add).
+    # A session counts once in every period it is active in; its length grows by
+    # the gap since its previous message, credited to the current period. Coming
+    # back after more than SESSION_IDLE_SECONDS starts a new visit instead.
+    resumed = last_at is not None and (now - last_at).total_seconds() > SESSION_IDLE_SECONDS
+    deltas = []
+    for period in INSIGHT_PERIODS:
+        start = _period_start(period, now)
+        if last_at is None or resumed:
+            deltas.append((period, start, 1, 0))
+            continue
+        new_in_period = 1 if _period_start(period, last_at) != start else 0
+        gap = max(int((now - last_at).total_seconds()), 0)
+        deltas.append((period, start, new_in_period, gap))
+    return deltas
+
+def _json_bucket(data, user_id: str, period: str, start):
+    return data.setdefault("insights", {}).setdefault(user_id, {}).setdefault(period, {}).setdefault(start.isoformat(), {
+        "messages": 0, "sessions": 0, "session_seconds": 0, "moods": {m: 0 for m in MOODS}
+    })
+
+def _update_rollups_json(data, user_id: str, session_id: str, now: datetime):
+    last_at = None
+    if session_id:
+        sessions = data.setdefault("session_stats", {}).setdefault(user_id, {})  # {session_id: last_at}
+        if session_id in sessions:
+            last_at = datetime.fromisoformat(sessions[session_id])
+        sessions[session_id] = now.isoformat()
+
+    for period, start, new_sessions, gap in _rollup_deltas(last_at, now):
+        if not session_id:
+            new_sessions, gap = 0, 0
+        bucket = _json_bucket(data, user_id, period, start)
+        bucket["messages"] += 1
+        bucket["sessions"] += new_sessions
+        bucket["session_seconds"] += gap
+
+def _update_rollups_mysql(cursor, user_id: str, session_id: str, now: datetime):
+    last_at = None
+    if session_id:
+        # Insert first: a locking read of a missing row takes a gap lock, and two
+        # new sessions sharing a gap would deadlock on their inserts
+        cursor.execute(
+            "INSERT IGNORE INTO session_stats (user_id, session_id, last_at) VALUES (%s, %s, %s)",
+            (user_id, session_id, now)
+        )
+        if cursor.rowcount == 0:
+            cursor.execute(
+                "SELECT last_at FROM session_stats WHERE user_id = %s AND session_id = %s FOR UPDATE",
+                (user_id, session_id)
+            )
+            last_at = cursor.fetchone()[0]
+            cursor.execute(
+                "UPDATE session_stats SET last_at = %s WHERE user_id = %s AND session_id = %s",
+                (now, user_id, session_id)
+            )
+
+    for period, start, new_sessions, gap in _rollup_deltas(last_at, now):
+        if not session_id:
+            new_sessions, gap = 0, 0
+        cursor.execute(
+            "INSERT INTO user_insights (user_id, period, period_start, messages, sessions, session_seconds) "
+            "VALUES (%s, %s, %s, 1, %s, %s) ON DUPLICATE KEY UPDATE messages = messages + 1, "
+            "sessions = sessions + VALUES(sessions), session_seconds = session_seconds + VALUES(session_seconds)",
+            (user_id, period, start, new_sessions, gap)
+        )
+
+def _add_mood_mysql(cursor, user_id: str, sentiment: str, ts: datetime):
+    mood_column = f"mood_{sentiment}"
+    for period in INSIGHT_PERIODS:
+        cursor.execute(
+            f"INSERT INTO user_insights (user_id, period, period_start, {mood_column}) VALUES (%s, %s, %s, 1) "
+            f"ON DUPLICATE KEY UPDATE {mood_column} = {mood_column} + 1",
+            (user_id, period, _period_start(period, ts))
+        )
+
+ROLLUP_RETRIES = 3
+
+def _apply_rollup(conn, update, *args):
+    """Run a rollup update in its own transaction, retrying deadlocks.
+
+    Failures are logged and dropped: they must never undo the chat_logs write
+    or switch the process to the JSON fallback.
+    """
+    for attempt in range(ROLLUP_RETRIES):
+        cursor = conn.cursor()
+        try:
+            update(cursor, *args)
+            conn.commit()
+            return
+        except mysql.connector.Error as e:
+            conn.rollback()
+            if e.errno != errorcode.ER_LOCK_DEADLOCK or attempt == ROLLUP_RETRIES - 1:
+                print(f"DEBUG: Rollup update failed: {e}")
+                return
+        except Exception as e:
+            conn.rollback()
+            print(f"DEBUG: Rollup update failed: {e}")
+            return
+        finally:
+            cursor.close()
+
 def save_log(role: str, content: str, user_id: str = None, session_id: str = None):
+    """Store one message; returns its log id (for record_sentiment) or None."""
+    global _use_json_fallback
+    now = datetime.utcnow()
+    uid = str(user_id) if user_id else None
+    # Insights are per user and counted on user messages only
+    track_insights = uid is not None and role == "user"
+
     if _use_json_fallback:
         try:
             data = _load_json_db()
+            log_id = data.get("next_log_id", 1)
+            data["next_log_id"] = log_id + 1
             data["chat_logs"].append({
+                "id": log_id,
                 "role": role,
                 "content": content,
-                "user_id": str(user_id) if user_id else None,
+                "user_id": uid,
                 "session_id": session_id,
-                "ts": datetime.utcnow().isoformat()
+                "sentiment": None,
+                "ts": now.isoformat()
             })
+            if track_insights:
+                _update_rollups_json(data, uid, session_id, now)
             _save_json_db(data)
-            return
+            return log_id
         except Exception as e:
             print(f"DEBUG: Error saving to JSON: {e}")
-            return
+            return None
 
     conn = get_db_connection()
     if not conn: 
         # If MySQL failed, try saving to JSON as fallback
         _use_json_fallback = True
-        save_log(role, content, user_id, session_id)
-        return
+        return save_log(role, content, user_id, session_id)
 
     try:
         cursor = conn.cursor()
         cursor.execute(
             "INSERT INTO chat_logs (role, content, user_id, session_id, ts) VALUES (%s, %s, %s, %s, %s)",
-            (role, content, str(user_id) if user_id else None, session_id, datetime.utcnow())
+            (role, content, uid, session_id, now)
         )
+        log_id = cursor.lastrowid
         conn.commit()
         cursor.close()
-        conn.close()
     except Exception as e:
         print(f"DEBUG: Error saving log to MySQL: {e}")
         # Try JSON as last resort
         _use_json_fallback = True
-        save_log(role, content, user_id, session_id)
+        return save_log(role, content, user_id, session_id)
+
+    if track_insights:
+        _apply_rollup(conn, _update_rollups_mysql, uid, session_id, now)
+    conn.close()
+    return log_id
+
+def record_sentiment(log_id, user_id: str, sentiment: str):
+    """Attach the parsed [MOOD: ...] of a saved user message and count it in the rollups."""
+    if log_id is None or sentiment not in MOODS:
+        return
+    uid = str(user_id) if user_id else None
+
+    if _use_json_fallback:
+        data = _load_json_db()
+        # The message was saved moments ago, so look from the end
+        log = next((l for l in reversed(data["chat_logs"]) if l.get("id") == log_id), None)
+        if not log:
+            return
+        log["sentiment"] = sentiment
+        if uid:
+            ts = datetime.fromisoformat(log["ts"])
+            for period in INSIGHT_PERIODS:
+                _json_bucket(data, uid, period, _period_start(period, ts))["moods"][sentiment] += 1
+        _save_json_db(data)
+        return
+
+    conn = get_db_connection()
+    if not conn: return
+    try:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE chat_logs SET sentiment = %s WHERE id = %s", (sentiment, log_id))
+        cursor.execute("SELECT ts FROM chat_logs WHERE id = %s", (log_id,))
+        row = cursor.fetchone()
+        conn.commit()
+        cursor.close()
+        if uid and row:
+            _apply_rollup(conn, _add_mood_mysql, uid, sentiment, row[0])
+    except Exception as e:
+        print(f"DEBUG: Error recording sentiment: {e}")
+    finally:
+        conn.close()
+
+def _read_archived(entries):
+    rows = []
+    for e in entries:
+        rows.extend(archive.read_session(e["segment"], e["byte_offset"], e["byte_length"]))
+    return rows
 
 def get_chat_history(user_id: str, session_id: str):
+    # Archived parts of a session are always older than its live rows, so they go first
+    uid = str(user_id) if user_id else None
     if _use_json_fallback:
         data = _load_json_db()
-        return [log for log in data["chat_logs"] 
-                if log.get("user_id") == (str(user_id) if user_id else None) and log.get("session_id") == session_id]
+        archived = _read_archived(e for e in data.get("chat_archive", [])
+                                  if e.get("user_id") == uid and e.get("session_id") == session_id)
+        return archived + [log for log in data["chat_logs"] 
+                if log.get("user_id") == uid and log.get("session_id") == session_id]
 
     conn = get_db_connection()
     if not conn: return []
     try:
         cursor = conn.cursor(dictionary=True)
+        cursor.execute(
+            "SELECT segment, byte_offset, byte_length FROM chat_archive WHERE user_id <=> %s AND session_id = %s ORDER BY id ASC",
+            (uid, session_id)
+        )
+        archived = _read_archived(cursor.fetchall())
+        for h in archived:
+            h["ts"] = datetime.fromisoformat(h["ts"])
         if user_id:
             cursor.execute(
-                "SELECT role, content, user_id, session_id, ts FROM chat_logs WHERE user_id = %s AND session_id = %s ORDER BY ts ASC",
+                "SELECT role, content, user_id, session_id, sentiment, ts FROM chat_logs WHERE user_id = %s AND session_id = %s ORDER BY ts ASC, id ASC",
                 (str(user_id), session_id)
             )
         else:
             cursor.execute(
-                "SELECT role, content, user_id, session_id, ts FROM chat_logs WHERE user_id IS NULL AND session_id = %s ORDER BY ts ASC",
+                "SELECT role, content, user_id, session_id, sentiment, ts FROM chat_logs WHERE user_id IS NULL AND session_id = %s ORDER BY ts ASC, id ASC",
                 (session_id,)
             )
-        history = cursor.fetchall()
+        history = archived + cursor.fetchall()
         cursor.close()
         conn.close()
         return history
@@ -198,7 +465,7 @@ def get_user_sessions(user_id: str):
     if _use_json_fallback:
         data = _load_json_db()
         sessions = set()
-        for log in data["chat_logs"]:
+        for log in data["chat_logs"] + data.get("chat_archive", []):
             if log.get("user_id") == (str(user_id) if user_id else None) and log.get("session_id"):
                 sessions.add(log["session_id"])
         return sorted(list(sessions), reverse=True)
@@ -207,16 +474,15 @@ def get_user_sessions(user_id: str):
     if not conn: return []
     try:
         cursor = conn.cursor()
-        if user_id:
-            cursor.execute(
-                "SELECT session_id FROM chat_logs WHERE user_id = %s AND session_id IS NOT NULL GROUP BY session_id ORDER BY MAX(ts) DESC",
-                (str(user_id),)
-            )
-        else:
-            cursor.execute(
-                "SELECT session_id FROM chat_logs WHERE user_id IS NULL AND session_id IS NOT NULL GROUP BY session_id ORDER BY MAX(ts) DESC",
-                (session_id,)
-            )
+        # Live and archived sessions, most recently active first
+        cursor.execute(
+            "SELECT session_id FROM ("
+            "SELECT session_id, MAX(ts) AS last_ts FROM chat_logs WHERE user_id <=> %s AND session_id IS NOT NULL GROUP BY session_id "
+            "UNION ALL "
+            "SELECT session_id, MAX(ended_at) AS last_ts FROM chat_archive WHERE user_id <=> %s GROUP BY session_id"
+            ") s GROUP BY session_id ORDER BY MAX(last_ts) DESC",
+            ((str(user_id) if user_id else None),) * 2
+        )
         sessions = [row[0] for row in cursor.fetchall()]
         cursor.close()
         conn.close()
@@ -225,6 +491,297 @@ def get_user_sessions(user_id: str):
         print(f"DEBUG: Error getting sessions: {e}")
         return []
 
+def _iter_keyset(conn, query: str, params: tuple, key_columns: tuple, batch_size: int):
+    """Yield rows of `query` page by page, each page a short query resuming after the
+    last key seen. `query` has an {after} slot before ORDER BY and ends in LIMIT %s."""
+    last = None
+    while True:
+        cursor = conn.cursor(dictionary=True)
+        if last is None:
+            cursor.execute(query.format(after=""), params + (batch_size,))
+        else:
+            after = f"AND ({', '.join(key_columns)}) > ({', '.join(['%s'] * len(key_columns))})"
+            cursor.execute(query.format(after=after), params + last + (batch_size,))
+        rows = cursor.fetchall()
+        cursor.close()
+        if not rows:
+            return
+        # Take the key before yielding: consumers may modify the rows
+        last = tuple(rows[-1][c] for c in key_columns)
+        yield from rows
+        if len(rows) < batch_size:
+            return
+
+def _export_row(row):
+    row.pop("id", None)
+    if isinstance(row.get("ts"), datetime):
+        row["ts"] = row["ts"].isoformat()
+    return row
+
+def iter_user_logs(user_id: str, batch_size: int = 500):
+    """Yield every message of a user, one session at a time (archived part first).
+
+    Reads in short keyset-paginated queries along idx_user_session_ts, so no
+    result set stays open while a slow client downloads, and memory stays flat
+    however long the history is. Timestamps are yielded as ISO strings. Errors
+    are raised, not swallowed, so a broken export fails instead of coming back
+    incomplete.
+    """
+    uid = str(user_id)
+    if _use_json_fallback:
+        data = _load_json_db()
+        sessions = {}  # {session_id: [rows]}, archived parts first
+        for entry in data.get("chat_archive", []):
+            if entry.get("user_id") == uid:
+                sessions.setdefault(entry["session_id"], []).extend(
+                    archive.read_session(entry["segment"], entry["byte_offset"], entry["byte_length"], strict=True))
+        for log in data["chat_logs"]:
+            if log.get("user_id") == uid:
+                sessions.setdefault(log.get("session_id"), []).append(log)
+        for rows in sessions.values():
+            for row in rows:
+                yield _export_row(dict(row))
+        return
+
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError("Database connection unavailable for export")
+    try:
+        archived = _iter_keyset(
+            conn,
+            "SELECT id, session_id, segment, byte_offset, byte_length FROM chat_archive "
+            "WHERE user_id = %s {after} ORDER BY session_id, id LIMIT %s",
+            (uid,), ("session_id", "id"), batch_size
+        )
+        live = _iter_keyset(
+            conn,
+            "SELECT id, role, content, user_id, session_id, sentiment, ts FROM chat_logs "
+            "WHERE user_id = %s AND session_id IS NOT NULL {after} ORDER BY session_id, ts, id LIMIT %s",
+            (uid,), ("session_id", "ts", "id"), batch_size
+        )
+        # Both streams are ordered by session_id: merge them so each session is
+        # written in one place, its archived part before its live rows
+        entry = next(archived, None)
+        row = next(live, None)
+        while entry or row:
+            session_id = min(x["session_id"] for x in (entry, row) if x)
+            while entry and entry["session_id"] == session_id:
+                for r in archive.read_session(entry["segment"], entry["byte_offset"], entry["byte_length"], strict=True):
+                    yield r
+                entry = next(archived, None)
+            while row and row["session_id"] == session_id:
+                yield _export_row(row)
+                row = next(live, None)
+
+        # Legacy rows saved without a session id
+        for row in _iter_keyset(
+            conn,
+            "SELECT id, role, content, user_id, session_id, sentiment, ts FROM chat_logs "
+            "WHERE user_id = %s AND session_id IS NULL {after} ORDER BY ts, id LIMIT %s",
+            (uid,), ("ts", "id"), batch_size
+        ):
+            yield _export_row(row)
+    finally:
+        conn.close()
+
+def _archive_rows(rows):
+    """Write one session's rows to its month segment; returns the index entry."""
+    started_at, ended_at = rows[0]["ts"], rows[-1]["ts"]
+    segment = archive.segment_name(started_at)
+    byte_offset, byte_length = archive.append_session(segment, [
+        {**r, "ts": r["ts"].isoformat()} for r in rows
+    ])
+    return {
+        "user_id": rows[0]["user_id"],
+        "session_id": rows[0]["session_id"],
+        "segment": segment,
+        "byte_offset": byte_offset,
+        "byte_length": byte_length,
+        "messages": len(rows),
+        "started_at": started_at,
+        "ended_at": ended_at,
+    }
+
+def archive_old_sessions(days: int = archive.ARCHIVE_AFTER_DAYS, batch_size: int = archive.ARCHIVE_BATCH_SIZE):
+    """Move sessions with no activity in the last `days` days to archive segments.
+
+    The segment is written before the rows are deleted, so a crash in between
+    leaves unreferenced bytes in the segment but never loses a message.
+    Only one run may archive at a time; an overlapping run is skipped.
+    The run also prunes idle session_stats rows.
+    Returns the number of sessions archived.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    with archive.retention_lock() as locked:
+        if not locked:
+            print("DEBUG: Another archive run is in progress, skipping.")
+            return 0
+        _prune_session_stats(batch_size)
+        return _archive_sessions_before(cutoff, batch_size)
+
+def _prune_session_stats(batch_size: int):
+    # A row idle for longer than SESSION_IDLE_SECONDS counts the same as a missing
+    # one in _rollup_deltas, so it only takes up space
+    cutoff = datetime.utcnow() - timedelta(seconds=SESSION_IDLE_SECONDS)
+
+    if _use_json_fallback:
+        data = _load_json_db()
+        stats = data.get("session_stats", {})
+        for uid in list(stats):
+            stats[uid] = {sid: last_at for sid, last_at in stats[uid].items()
+                          if datetime.fromisoformat(last_at) >= cutoff}
+            if not stats[uid]:
+                del stats[uid]
+        _save_json_db(data)
+        return
+
+    conn = get_db_connection()
+    if not conn: return
+    try:
+        cursor = conn.cursor()
+        # Small batches keep row locks short while chats are being written
+        while True:
+            cursor.execute("DELETE FROM session_stats WHERE last_at < %s LIMIT %s", (cutoff, batch_size))
+            conn.commit()
+            if cursor.rowcount < batch_size:
+                break
+        cursor.close()
+    except Exception as e:
+        conn.rollback()
+        print(f"DEBUG: Error pruning session stats: {e}")
+    finally:
+        conn.close()
+
+def _archive_sessions_before(cutoff: datetime, batch_size: int):
+    if _use_json_fallback:
+        data = _load_json_db()
+        sessions = {}
+        for log in data["chat_logs"]:
+            if log.get("session_id"):
+                sessions.setdefault((log.get("user_id"), log["session_id"]), []).append(log)
+        index = data.setdefault("chat_archive", [])
+        archived = set()
+        for key, logs in sessions.items():
+            if len(archived) >= batch_size:
+                break
+            rows = [{**log, "ts": datetime.fromisoformat(log["ts"])} for log in logs]
+            if max(r["ts"] for r in rows) >= cutoff:
+                continue
+            entry = _archive_rows(rows)
+            index.append({**entry, "started_at": entry["started_at"].isoformat(), "ended_at": entry["ended_at"].isoformat()})
+            archived.add(key)
+        data["chat_logs"] = [log for log in data["chat_logs"]
+                             if (log.get("user_id"), log.get("session_id")) not in archived]
+        _save_json_db(data)
+        return len(archived)
+
+    conn = get_db_connection()
+    if not conn: return 0
+    moved = 0
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(
+            "SELECT DISTINCT o.user_id, o.session_id FROM chat_logs o "
+            "WHERE o.ts < %s AND o.session_id IS NOT NULL AND NOT EXISTS ("
+            "SELECT 1 FROM chat_logs n WHERE n.user_id <=> o.user_id AND n.session_id = o.session_id AND n.ts >= %s"
+            ") LIMIT %s",
+            (cutoff, cutoff, batch_size)
+        )
+        candidates = cursor.fetchall()
+        cursor.close()
+        for candidate in candidates:
+            try:
+                if _archive_session_mysql(conn, candidate["user_id"], candidate["session_id"], cutoff):
+                    moved += 1
+            except Exception as e:
+                # Skip just this session; its rows stay live for the next run
+                conn.rollback()
+                print(f"DEBUG: Error archiving session {candidate['session_id']}: {e}")
+    except Exception as e:
+        print(f"DEBUG: Error archiving sessions: {e}")
+    finally:
+        conn.close()
+    return moved
+
+def _archive_session_mysql(conn, user_id, session_id, cutoff: datetime) -> bool:
+    cursor = conn.cursor(dictionary=True)
+    try:
+        # Re-read under row locks: skip the session if it was archived meanwhile
+        # or has become active again since the candidate scan
+        cursor.execute(
+            "SELECT id, role, content, user_id, session_id, sentiment, ts FROM chat_logs "
+            "WHERE user_id <=> %s AND session_id = %s ORDER BY ts ASC, id ASC FOR UPDATE",
+            (user_id, session_id)
+        )
+        rows = cursor.fetchall()
+        if not rows or rows[-1]["ts"] >= cutoff:
+            conn.rollback()
+            return False
+        ids = [r.pop("id") for r in rows]
+        entry = _archive_rows(rows)
+        cursor.execute(
+            "INSERT INTO chat_archive (user_id, session_id, segment, byte_offset, byte_length, messages, started_at, ended_at) "
+            "VALUES (%(user_id)s, %(session_id)s, %(segment)s, %(byte_offset)s, %(byte_length)s, %(messages)s, %(started_at)s, %(ended_at)s)",
+            entry
+        )
+        cursor.execute(
+            f"DELETE FROM chat_logs WHERE id IN ({', '.join(['%s'] * len(ids))})",
+            tuple(ids)
+        )
+        conn.commit()
+        return True
+    finally:
+        cursor.close()
+
+def _format_insight(period_start, messages, sessions, session_seconds, moods):
+    if not isinstance(period_start, str):
+        period_start = period_start.isoformat()
+    return {
+        "period_start": period_start,
+        "messages": messages,
+        "sessions": sessions,
+        "session_seconds": session_seconds,
+        "avg_session_seconds": round(session_seconds / sessions) if sessions else 0,
+        "moods": moods,
+    }
+
+def get_user_insights(user_id: str, period: str = "day", limit: int = 30):
+    """Latest `limit` rollups for a user, newest first. Reads only the rollup rows."""
+    if period not in INSIGHT_PERIODS or not user_id:
+        return []
+    uid = str(user_id)
+
+    if _use_json_fallback:
+        data = _load_json_db()
+        buckets = data.get("insights", {}).get(uid, {}).get(period, {})
+        starts = sorted(buckets.keys(), reverse=True)[:limit]
+        return [
+            _format_insight(start, b["messages"], b["sessions"], b["session_seconds"], b["moods"])
+            for start, b in ((start, buckets[start]) for start in starts)
+        ]
+
+    conn = get_db_connection()
+    if not conn: return []
+    try:
+        cursor = conn.cursor(dictionary=True)
+        mood_columns = ", ".join(f"mood_{m}" for m in MOODS)
+        cursor.execute(
+            f"SELECT period_start, messages, sessions, session_seconds, {mood_columns} FROM user_insights "
+            "WHERE user_id = %s AND period = %s ORDER BY period_start DESC LIMIT %s",
+            (uid, period, limit)
+        )
+        rows = cursor.fetchall()
+        cursor.close()
+        conn.close()
+        return [
+            _format_insight(r["period_start"], r["messages"], r["sessions"], r["session_seconds"],
+                            {m: r[f"mood_{m}"] for m in MOODS})
+            for r in rows
+        ]
+    except Exception as e:
+        print(f"DEBUG: Error getting insights: {e}")
+        return []
+
 def get_user_by_email(email: str):
     if _use_json_fallback:
         data = _load_json_db()